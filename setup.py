@@ -23,7 +23,7 @@ setup(
     include_package_data=True,
     package_data={"mecoda_minka": ["py.typed", "data/*.csv"]},
     py_modules=[splitext(basename(path))[0] for path in glob("src/*.py")],
-    python_requires=">=3.6",
+    python_requires=">=3.9",
     classifiers=[
         "Development Status :: 4 - Beta",
         "Intended Audience :: Developers",
@@ -32,12 +32,11 @@ setup(
         "Operating System :: POSIX",
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.7",
-        "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
         "Programming Language :: Python :: 3.11",
         "Topic :: Utilities",
         "Natural Language :: English",
     ],
-    install_requires=["pydantic", "requests", "pandas", "folium"],
+    install_requires=["pydantic>=2", "requests", "pandas>=2.0", "folium"],
+    extras_require={"fast": ["orjson", "lxml"]},
 )
@@ -1,6 +1,8 @@
 from .models import Observation, Project, Photo, ICONIC_TAXON, TAXONS
 from .mecoda_minka import (
     get_obs,
+    get_obs_df,
+    iter_obs,
     get_project,
     get_count_by_taxon,
     get_dfs,
@@ -18,6 +20,8 @@ __all__ = [
     "ICONIC_TAXON",
     "TAXONS",
     "get_obs",
+    "get_obs_df",
+    "iter_obs",
     "get_dfs",
     "get_project",
     "get_count_by_taxon",
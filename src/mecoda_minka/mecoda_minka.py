@@ -1,54 +1,172 @@
+import collections
+import functools
 import importlib.resources as resources
+import importlib.util
+import inspect
+import io
+import itertools
 import math
 import os
-from contextlib import suppress
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
-import numpy as np
 import pandas as pd  # type: ignore
 import requests
 import urllib3
+from pydantic import TypeAdapter
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from .models import ICONIC_TAXON, TAXONS, Observation, Photo, Project
+from .models import ICONIC_TAXON, TAXONS_SET, Observation, Photo, Project
 
 urllib3.disable_warnings()
 
 # Variables
 BASE_URL = "https://minka-sdg.org"
 API_PATH = "https://api.minka-sdg.org/v1"
+PER_PAGE = 200  # maximum number of results per page allowed by the API
+MAX_PAGES = 50  # the API doesn't return results beyond the first 10,000
+PAGE_WORKERS = 8  # concurrent page requests
+ITER_PREFETCH = 2  # pages requested ahead of the one iter_obs is reading
+PHOTO_WORKERS = 16  # concurrent photo downloads, as many as pooled connections
+PHOTO_CHUNK_SIZE = 1 << 20  # photos are written to disk in blocks of 1 MiB
+DWC_WORKERS = 16  # concurrent downloads of DarwinCore xml
+DWC_PAGE_BATCH = 8  # DarwinCore pages requested at a time by query
+EXTRA_INFO_BATCH = PER_PAGE  # observation ids requested at a time by extra_info
+# lxml parses the DarwinCore xml faster, etree is used if it isn't installed
+XML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "etree"
+# orjson parses the pages of results faster, requests' json is used if not
+if importlib.util.find_spec("orjson"):
+    import orjson
+else:
+    orjson = None
+
+# Shared session, keeps connections alive between requests. Throttled (429)
+# and failed requests are retried with backoff, waiting what the API asks in
+# Retry-After; the last response is returned if they keep failing
+_RETRY = Retry(
+    total=5,
+    backoff_factor=1,
+    status_forcelist=(429, 500, 502, 503, 504),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_maxsize=16, max_retries=_RETRY))
+
+# Observation fields with integer values
+_INT_FIELDS = [
+    name
+    for name, field in Observation.model_fields.items()
+    if field.annotation in (int, Optional[int])
+]
+
+# Validates and dumps a whole list of observations in a single call instead
+# of once per observation
+_OBSERVATIONS_ADAPTER = TypeAdapter(List[Observation])
+
+
+@functools.lru_cache(maxsize=1)
+def _load_taxon_df() -> pd.DataFrame:
+    """
+    Internal function that reads the taxon tree the first time it is needed,
+    instead of on import, and keeps it for the rest of calls.
+    """
+    try:
+        return pd.read_csv(
+            "https://raw.githubusercontent.com/eosc-cos4cloud/mecoda-minka/refs/heads/master/src/mecoda_minka/data/taxon_tree.csv"
+        )
 
+    except:
+        file_path = resources.files("mecoda_minka.data") / "taxon_tree.csv"
+        return pd.read_csv(file_path)
 
-try:
-    df_taxon = pd.read_csv(
-        "https://raw.githubusercontent.com/eosc-cos4cloud/mecoda-minka/refs/heads/master/src/mecoda_minka/data/taxon_tree.csv"
-    )
 
-except:
-    file_path = resources.files("mecoda_minka.data") / "taxon_tree.csv"
-    df_taxon = pd.read_csv(file_path)
+def __getattr__(name: str):
+    # df_taxon is still available as a module attribute, loaded on first use
+    if name == "df_taxon":
+        return _load_taxon_df()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-def get_project(project: Union[str, int]) -> List[Project]:
-    """Download information of a project from id or name"""
+def _ttl_cache(ttl: int, maxsize: int = 512):
+    """
+    Internal decorator that keeps the results of a function in memory for
+    ttl seconds, keyed on its positional arguments. Empty results (nothing
+    found) are not kept. The decorated function gets a cache_clear method
+    to empty it and a cache_discard method to drop the result of some
+    arguments.
+    """
+
+    def decorator(func):
+        cache = {}
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            now = time.monotonic()
+            hit = cache.get(args)
+            if hit is not None and now - hit[0] < ttl:
+                return hit[1]
+            result = func(*args)
+            if not result:
+                # asked again next time, e.g. a project id not found yet
+                return result
+            if len(cache) >= maxsize:
+                # drop the oldest entry
+                cache.pop(next(iter(cache)))
+            cache[args] = (now, result)
+            return result
+
+        wrapper.cache_clear = cache.clear
+        wrapper.cache_discard = lambda *args: cache.pop(args, None)
+        return wrapper
+
+    return decorator
+
+
+def get_project(
+    project: Union[str, int],
+    force_refresh: bool = False,
+    session: Optional[requests.Session] = None,
+) -> List[Project]:
+    """
+    Download information of a project from id or name. Results are kept
+    for 10 minutes, force_refresh=True downloads them again.
+    """
+    if session is None:
+        session = _SESSION
+    if force_refresh:
+        _get_project.cache_discard(project, session)
+    # copies of the cached projects, so callers can't modify them
+    return [proj.model_copy(deep=True) for proj in _get_project(project, session)]
 
+
+@_ttl_cache(ttl=600)
+def _get_project(
+    project: Union[str, int], session: requests.Session = _SESSION
+) -> Tuple[Project, ...]:
     if type(project) is int:
         url = f"{BASE_URL}/projects/{project}.json"
-        page = requests.get(url)
+        page = session.get(url)
 
         if page.status_code == 404:
             print("Project ID not found")
-            return []
+            return ()
         else:
-            resultado = [Project(**page.json())]
+            resultado = (Project(**page.json()),)
             return resultado
 
     elif type(project) is str:
         url = f"{BASE_URL}/projects/search.json?q={project}"
-        page = requests.get(url)
-        resultado = [Project(**proj) for proj in page.json()]
+        page = session.get(url)
+        resultado = tuple(Project(**proj) for proj in page.json())
         return resultado
 
+    return ()
+
 
 def get_obs(
     query: Optional[str] = None,
@@ -71,40 +189,161 @@ def get_obs(
     id_below: Optional[int] = None,
     updated_since: Optional[str] = None,  # Must be updated on or after this date
     api_token: Optional[str] = None,
-) -> List[Observation]:
+    as_dict: bool = False,
+    session: Optional[requests.Session] = None,
+) -> Union[List[Observation], List[Dict[str, Any]]]:
     """
-    Function to extract the observations and that supports different filters
+    Function to extract the observations and that supports different filters.
+    With as_dict=True, plain dicts with the Observation fields are returned
+    instead of Observation objects, ready to be passed to get_dfs.
+    A requests.Session can be given to reuse it instead of the shared one.
+    """
+    results = _get_results(
+        _filters(locals()),
+        num_max=num_max,
+        api_token=api_token,
+        session=session,
+    )
+    return _build_observations(results, as_dict)
+
+
+def get_obs_df(
+    query: Optional[str] = None,
+    id_project: Optional[int] = None,
+    id_obs: Optional[int] = None,
+    user: Optional[str] = None,
+    taxon: Optional[str] = None,
+    taxon_id: Optional[int] = None,
+    place_id: Optional[int] = None,
+    introduced: Optional[bool] = None,
+    year: Optional[int] = None,
+    num_max: Optional[int] = None,
+    starts_on: Optional[str] = None,  # Must be observed on or after this date
+    ends_on: Optional[str] = None,  # Must be observed on or before this date
+    created_on: Optional[str] = None,  # Day YYYY-MM-DD
+    created_d1: Optional[str] = None,  # Must be created on or after this date
+    created_d2: Optional[str] = None,  # Must be created on or before this date
+    grade: Optional[str] = None,  # Must be one of this: research, casual, needs_id
+    id_above: Optional[int] = None,
+    id_below: Optional[int] = None,
+    updated_since: Optional[str] = None,  # Must be updated on or after this date
+    api_token: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+) -> pd.DataFrame:
+    """
+    Function to extract the observations as a dataframe with the Observation
+    fields, with the same filters as get_obs. No Observation objects are
+    built; the dataframe can be passed to get_dfs. Integer fields such as
+    taxon_id or user_id are nullable Int64 columns.
+    """
+    results = _get_results(
+        _filters(locals()),
+        num_max=num_max,
+        api_token=api_token,
+        session=session,
+    )
+    df = pd.DataFrame.from_records(
+        _build_observations(results, as_dict=True),
+        columns=list(Observation.model_fields),
+    )
+    # missing values would turn the ids into floats
+    for field in _INT_FIELDS:
+        df[field] = pd.to_numeric(df[field], errors="coerce").astype("Int64")
+    return df
+
+
+def iter_obs(
+    query: Optional[str] = None,
+    id_project: Optional[int] = None,
+    id_obs: Optional[int] = None,
+    user: Optional[str] = None,
+    taxon: Optional[str] = None,
+    taxon_id: Optional[int] = None,
+    place_id: Optional[int] = None,
+    introduced: Optional[bool] = None,
+    year: Optional[int] = None,
+    num_max: Optional[int] = None,
+    starts_on: Optional[str] = None,  # Must be observed on or after this date
+    ends_on: Optional[str] = None,  # Must be observed on or before this date
+    created_on: Optional[str] = None,  # Day YYYY-MM-DD
+    created_d1: Optional[str] = None,  # Must be created on or after this date
+    created_d2: Optional[str] = None,  # Must be created on or before this date
+    grade: Optional[str] = None,  # Must be one of this: research, casual, needs_id
+    id_above: Optional[int] = None,
+    id_below: Optional[int] = None,
+    updated_since: Optional[str] = None,  # Must be updated on or after this date
+    api_token: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+) -> Iterator[Observation]:
+    """
+    Generator with the same filters as get_obs that yields the Observation
+    objects of each page as soon as it arrives, while the next pages are
+    still being downloaded. Only a couple of pages are requested ahead, so
+    stopping early doesn't download the rest of the query.
+    """
+    for results in _iter_results(
+        _filters(locals()),
+        num_max=num_max,
+        api_token=api_token,
+        session=session,
+        prefetch=ITER_PREFETCH,
+    ):
+        yield from _build_observations(results)
+
+
+def _filters(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Internal function that takes the arguments of get_obs, get_obs_df or
+    iter_obs and returns the filters of the url by name, so they are never
+    forwarded by position.
+    """
+    return {name: arguments[name] for name in _URL_FILTERS}
+
+
+def _get_results(
+    filters: Dict[str, Any],
+    num_max: Optional[int] = None,
+    api_token: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Internal function that downloads the observations that match the filters
+    and returns the results as given by the API, all pages in a single list.
+    """
+    pages = _iter_results(filters, num_max, api_token, session)
+    return [result for page in pages for result in page]
+
+
+def _iter_results(
+    filters: Dict[str, Any],
+    num_max: Optional[int] = None,
+    api_token: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+    prefetch: int = PAGE_WORKERS,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Internal generator that downloads the observations that match the filters
+    (the arguments of _build_url, by name) and yields the results of each page
+    as given by the API, as soon as the page arrives.
     """
 
     print("Generating list of observations:")
 
     url = _build_url(
-        query,
-        id_project,
-        id_obs,
-        user,
-        taxon,
-        taxon_id,
-        place_id,
-        introduced,
-        year,
-        starts_on,
-        ends_on,
-        created_on,
-        created_d1,
-        created_d2,
-        grade,
-        id_above,
-        id_below,
-        updated_since,
+        **filters,
+        # no need to download a full page when fewer results are wanted
+        per_page=min(num_max, PER_PAGE) if num_max else PER_PAGE,
     )
-    session = requests.Session()
+    if session is None:
+        session = _SESSION
     if api_token == None:
         headers = None
     else:
         headers = {"Authorization": api_token}
     try:
-        total_obs = session.get(url, headers=headers).json()["total_results"]
+        # the first page also gives the total, it is reused by _request
+        first_response = _json(session.get(url, headers=headers))
+        total_obs = first_response["total_results"]
         print("Total observations to download:", total_obs)
     except requests.exceptions.RequestException as e:
         raise Exception(f"Network error: {e}")
@@ -113,10 +352,13 @@ def get_obs(
     except ValueError as e:
         raise Exception(f"Invalid JSON response: {e}")
 
+    id_above = filters["id_above"]
     if total_obs <= 10000 or (num_max != None and num_max <= 10000):
-        observations = _request(url, num_max, session, api_token)
+        yield from _iter_pages(
+            url, num_max, session, api_token, first_response, prefetch
+        )
     else:
-        observations = []
+        count = 0
         # download obs using bins of 10000 ids
         url_today_last_ob = (
             f"https://api.minka-sdg.org/v1/observations?order=desc&order_by=created_at"
@@ -141,16 +383,16 @@ def get_obs(
             url = url.replace(f"&id_above={id_above}", "")
             batch_url = f"{url}&id_above={n*10000}&id_below={(n+1)*10000+1}"
             print(batch_url)
-            obs_batch = _request(batch_url, num_max, session, api_token)
-            if len(obs_batch) > 0:
-                observations.extend(obs_batch)
-                # stop when num_max is exceeded
-                if num_max is not None:
-                    if len(observations) > num_max:
-                        observations = observations[:num_max]
-                        break
-
-    return observations
+            # each bin only downloads the observations still missing
+            remaining = None if num_max is None else num_max - count
+            for page in _iter_pages(
+                batch_url, remaining, session, api_token, None, prefetch
+            ):
+                count += len(page)
+                yield page
+            # stop when num_max is reached
+            if num_max is not None and count >= num_max:
+                break
 
 
 def _build_url(
@@ -172,6 +414,7 @@ def _build_url(
     id_above: Optional[int] = None,
     id_below: Optional[int] = None,
     updated_since: Optional[date] = None,
+    per_page: int = PER_PAGE,
 ) -> str:
     """
     Internal function to build the url to which the observation request
@@ -206,7 +449,7 @@ def _build_url(
         args.append(f'q="{query}"')
     if taxon is not None:
         taxon = taxon.title()
-        if taxon not in TAXONS:
+        if taxon not in TAXONS_SET:
             raise ValueError("Not a valid taxonomy")
         args.append(f"iconic_taxa={taxon}")
     if place_id is not None:
@@ -226,216 +469,268 @@ def _build_url(
         args.append(f"id_below={id_below}")
     if updated_since is not None:
         args.append(f"updated_since={updated_since}")
-    url = f'{base_url}?{"&".join(args)}&per_page=200'
+    url = f'{base_url}?{"&".join(args)}&per_page={per_page}'
     # if no parameter indicated, it returns the last records
     print(url)
     return url
 
 
-def _build_observations(observations_data: List[Dict[str, Any]]) -> List[Observation]:
+# names of the filters of get_obs, get_obs_df and iter_obs that go in the url
+_URL_FILTERS = tuple(
+    name for name in inspect.signature(_build_url).parameters if name != "per_page"
+)
+
+
+def _build_observations(
+    observations_data: List[Dict[str, Any]], as_dict: bool = False
+) -> Union[List[Observation], List[Dict[str, Any]]]:
     """
     Inner function that takes a list of dictionaries and returns a list
-    of Observation objects.
+    of Observation objects, or of plain dicts with the Observation fields
+    if as_dict is True. The dicts are not validated.
     """
-    observations = []
+    # photos are dicts too when the observations are
+    build_photo = _photo_fields if as_dict else _build_photo
 
     for data in observations_data:
-        with suppress(KeyError):
-            if data["place_guess"] is not None:
-                data["place_name"] = data["place_guess"].replace("\r\n", " ").strip()
+        if data.get("place_guess") is not None:
+            data["place_name"] = data["place_guess"].replace("\r\n", " ").strip()
+
+        taxon = data.get("taxon") or {}
+        taxon_id = taxon.get("id")
+        data["taxon_id"] = int(taxon_id) if taxon_id is not None else None
+        data["taxon_name"] = taxon.get("name")
+        data["taxon_rank"] = taxon.get("rank")
+        data["taxon_ancestry"] = taxon.get("ancestry")
+
+        # las observaciones ocultas tienen la ubicación real en private_location
+        if data.get("obscured") is True:
+            location = data.get("private_location")
+        else:
+            location = data.get("location")
+        coordinates = location.split(",") if location else []
+        if len(coordinates) > 1:
+            data["latitude"] = float(coordinates[0])
+            data["longitude"] = float(coordinates[1])
+        else:
+            data["latitude"] = None
+            data["longitude"] = None
 
-        with suppress(KeyError):
-            try:
-                data["taxon_id"] = int(data["taxon"]["id"])
-                data["taxon_name"] = data["taxon"]["name"]
-                data["taxon_rank"] = data["taxon"]["rank"]
-                data["taxon_ancestry"] = data["taxon"]["ancestry"]
-            except:
-                data["taxon_id"] = None
-                data["taxon_name"] = None
-                data["taxon_rank"] = None
-                data["taxon_ancestry"] = None
-
-        with suppress(KeyError):
-            try:
-                location = data["location"].split(",")
-                data["latitude"] = location[0]
-                data["longitude"] = location[1]
-            except:
-                data["latitude"] = None
-                data["longitude"] = None
-
-        with suppress(KeyError):
-            if data["obscured"] == True:
-                try:
-                    location = data["private_location"].split(",")
-                    data["latitude"] = location[0]
-                    data["longitude"] = location[1]
-                except:
-                    data["latitude"] = None
-                    data["longitude"] = None
-
-        with suppress(KeyError):
-            lista_fotos = []
-            # Caso para las observaciones filtradas por id
-            if len(observations_data) == 1:
-                lista_fotos = [
-                    Photo(
-                        id=observation_photo["photo"]["id"],
-                        large_url=observation_photo["photo"]["url"].replace(
-                            "/square", "/large"
-                        ),
-                        medium_url=observation_photo["photo"]["url"].replace(
-                            "/square", "/medium"
-                        ),
-                        small_url=observation_photo["photo"]["url"].replace(
-                            "/square", "/small"
-                        ),
-                        license_photo=observation_photo["photo"]["license_code"],
-                        attribution=observation_photo["photo"]["attribution"],
-                    )
-                    for observation_photo in data["observation_photos"]
-                ]
-            # Resto de búsquedas
-            else:
-                lista_fotos = [
-                    Photo(
-                        id=observation_photo["photo"]["id"],
-                        large_url=observation_photo["photo"]["url"].replace(
-                            "/square", "/large"
-                        ),
-                        medium_url=observation_photo["photo"]["url"].replace(
-                            "/square", "/medium"
-                        ),
-                        small_url=observation_photo["photo"]["url"].replace(
-                            "/square", "/small"
-                        ),
-                        license_photo=observation_photo["photo"]["license_code"],
-                        attribution=observation_photo["photo"]["attribution"],
-                    )
-                    for observation_photo in data["observation_photos"]
-                ]
-            data["photos"] = lista_fotos
-
-        with suppress(KeyError):
-            try:
-                try:
-                    data["iconic_taxon"] = ICONIC_TAXON[
-                        data["taxon"]["iconic_taxon_id"]
-                    ]
-                except:
-                    # request de un solo id de observación
-                    data["iconic_taxon"] = ICONIC_TAXON[data["iconic_taxon_id"]]
-            except:
-                data["iconic_taxon"] = None
+        if data.get("observation_photos") is not None:
+            data["photos"] = [
+                build_photo(observation_photo["photo"])
+                for observation_photo in data["observation_photos"]
+            ]
 
-        with suppress(KeyError):
-            data["user_id"] = data["user"]["id"]
-            data["user_login"] = data["user"]["login"]
+        # request de un solo id de observación: iconic_taxon_id fuera de taxon
+        data["iconic_taxon"] = ICONIC_TAXON.get(
+            taxon.get("iconic_taxon_id"), ICONIC_TAXON.get(data.get("iconic_taxon_id"))
+        )
 
-        with suppress(KeyError):
-            try:
-                data["license_obs"] = data["license_code"]
-            except:
-                data["license_obs"] = data["license"]
+        user = data.get("user")
+        if user is not None:
+            data["user_id"] = user.get("id")
+            data["user_login"] = user.get("login")
+
+        if "license_code" in data:
+            data["license_obs"] = data["license_code"]
+        else:
+            data["license_obs"] = data.get("license")
 
         # removal of line breaks in the description field
-        with suppress(KeyError):
-            if data["description"] is not None:
-                data["description"] = data["description"].replace("\r\n", " ")
+        if data.get("description") is not None:
+            data["description"] = data["description"].replace("\r\n", " ")
 
         # list of identifiers
-        with suppress(KeyError):
-            identifications = data["identifications"]
-            if len(identifications) > 0:
-                lista_identifiers = [
-                    identification["user"]["login"]
-                    for identification in identifications
-                ]
-                data["identifiers"] = ", ".join(lista_identifiers)
-            else:
-                data["identifiers"] = None
+        identifications = data.get("identifications")
+        if identifications is not None:
+            lista_identifiers = [
+                identification["user"]["login"] for identification in identifications
+            ]
+            data["identifiers"] = ", ".join(lista_identifiers) or None
+
+    if as_dict:
+        return [
+            {
+                **{field: data.get(field) for field in Observation.model_fields},
+                "photos": data.get("photos") or [],
+            }
+            for data in observations_data
+        ]
 
-        observation = Observation(**data)
+    # the whole page is validated in a single call
+    return _OBSERVATIONS_ADAPTER.validate_python(observations_data)
 
-        observations.append(observation)
 
-    return observations
+def _build_photo(photo: Dict[str, Any]) -> Photo:
+    """
+    Inner function that builds a Photo from the API photo dict. The fields
+    are already ids and strings, so validation is skipped.
+    """
+    return Photo.model_construct(**_photo_fields(photo))
 
 
-def _request(
-    arg_url: str, num_max: Optional[int] = None, session=None, api_token=None
-) -> List[Observation]:
+def _photo_fields(photo: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Inner function that takes the API photo dict and returns the Photo
+    fields, deriving the three size urls from a single split of the
+    square url.
+    """
+    url = photo["url"]
+    base, square, tail = url.partition("/square")
+    return {
+        "id": photo["id"],
+        "large_url": f"{base}/large{tail}" if square else url,
+        "medium_url": f"{base}/medium{tail}" if square else url,
+        "small_url": f"{base}/small{tail}" if square else url,
+        "license_photo": photo.get("license_code"),
+        "attribution": photo.get("attribution"),
+    }
+
+
+def _iter_pages(
+    arg_url: str,
+    num_max: Optional[int] = None,
+    session=None,
+    api_token=None,
+    first_response: Optional[Dict[str, Any]] = None,
+    prefetch: int = PAGE_WORKERS,
+) -> Iterator[List[Dict[str, Any]]]:
     """
-    Internal function that performs the API request and returns
-    the list of Observation objects.
+    Internal generator that performs the API request and yields the results
+    of each page as given by the API. If the first page has already been
+    downloaded, its parsed json can be passed as first_response. The rest of
+    pages are requested concurrently, at most prefetch of them ahead of the
+    page being yielded, and yielded in order.
     """
-    observations = []
-    n = 1
+    count = 0
 
     if session is None:
-        session = requests.Session()
+        session = _SESSION
 
     if api_token:
         headers = {"Authorization": api_token}
     else:
         headers = None
-    page = session.get(arg_url, headers=headers)
 
-    if page.status_code == 404:
-        raise ValueError("Not found")
+    if first_response is None:
+        page = session.get(arg_url, headers=headers)
 
-    elif page.status_code == 200:
-        try:
-            response = page.json()
-            if "results" not in response:
-                raise ValueError("Invalid response format: missing 'results' field")
-            while len(response["results"]) == 200:
-                observations.extend(_build_observations(response["results"]))
-                n += 1
-                if n > 50:
-                    print("WARNING: Only the first 10,000 results are displayed")
-                    break
-                if num_max is not None and len(observations) >= num_max:
-                    break
-                url = f"{arg_url}&page={n}"
-                page = session.get(url, headers=headers)
-                response = page.json()
-                if "results" not in response:
-                    raise ValueError("Invalid response format: missing 'results' field")
-                print(f"Number of elements: {len(observations)}")
+        if page.status_code == 404:
+            raise ValueError("Not found")
+        elif page.status_code != 200:
+            return
 
-            observations.extend(_build_observations(response["results"]))
-            if num_max:
-                observations = observations[:num_max]
+    try:
+        response = _json(page) if first_response is None else first_response
+        results = _page_results(response)
+        if num_max:
+            results = results[:num_max]
+        count += len(results)
+        yield results
+
+        # the total tells how many pages are left
+        pages = math.ceil(response.get("total_results", 0) / PER_PAGE)
+        if num_max:
+            pages = min(pages, math.ceil(num_max / PER_PAGE))
+        if pages > MAX_PAGES:
+            print("WARNING: Only the first 10,000 results are displayed")
+            pages = MAX_PAGES
+
+        if len(results) == PER_PAGE and pages > 1:
+            urls = (f"{arg_url}&page={n}" for n in range(2, pages + 1))
+            executor = ThreadPoolExecutor(max_workers=min(prefetch, PAGE_WORKERS))
+
+            def submit(url):
+                return executor.submit(_fetch_page, session, url, headers)
 
-        except ValueError as e:
-            print(f"Error: {str(e)}")
+            try:
+                # a window of pages is downloaded ahead of the one being yielded,
+                # the next page is requested each time one is taken out
+                pending = collections.deque(
+                    map(submit, itertools.islice(urls, prefetch))
+                )
+                while pending:
+                    page_results = pending.popleft().result()
+                    pending.extend(map(submit, itertools.islice(urls, 1)))
+                    if num_max:
+                        page_results = page_results[: num_max - count]
+                    count += len(page_results)
+                    print(f"Number of elements: {count}")
+                    yield page_results
+            finally:
+                # when the caller stops early, the pages not started are dropped
+                executor.shutdown(cancel_futures=True)
+
+    except (ValueError, requests.exceptions.HTTPError) as e:
+        print(f"Error: {str(e)}")
+
+    print(f"Number of elements: {count}")
+
+
+def _fetch_page(
+    session, url: str, headers: Optional[Dict[str, str]]
+) -> List[Dict[str, Any]]:
+    """
+    Internal function that downloads a page of observations and returns its
+    results. Raises an HTTPError for error responses and a ValueError when
+    there are no results.
+    """
+    response = session.get(url, headers=headers)
+    response.raise_for_status()
+    return _page_results(_json(response))
 
-        print(f"Number of elements: {len(observations)}")
 
-    return observations
+def _json(response: requests.Response) -> Any:
+    """
+    Internal function that parses the json body of a response, with orjson
+    when it is installed. Both raise a ValueError on invalid json.
+    """
+    if orjson is None:
+        return response.json()
+    return orjson.loads(response.content)
+
+
+def _page_results(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Internal function that returns the results of a page of observations.
+    """
+    if "results" not in response:
+        raise ValueError("Invalid response format: missing 'results' field")
+    return response["results"]
 
 
-def get_dfs(observations, df_taxon=df_taxon) -> pd.DataFrame:
+def get_dfs(observations, df_taxon: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Function to extract dataframe from observations and dataframe from photos.
+    Accepts Observation objects, the dicts returned by get_obs(as_dict=True)
+    or the dataframe returned by get_obs_df. The taxonomy columns are taken
+    from the taxon tree of the package, unless another one is given as df_taxon.
     """
-    df = pd.DataFrame([obs.model_dump() for obs in observations])
-    df["taxon_id"] = df["taxon_id"].astype(float).apply(lambda x: f"{x:.0f}")
+    if isinstance(observations, pd.DataFrame):
+        df = observations.copy()
+    else:
+        # generators such as iter_obs and tuples are read into a list first
+        observations = list(observations)
+        if len(observations) > 0 and isinstance(observations[0], dict):
+            df = pd.DataFrame.from_records(observations)
+            # raw values from the API are not coerced by pydantic
+            df["latitude"] = pd.to_numeric(df["latitude"], errors="coerce")
+            df["longitude"] = pd.to_numeric(df["longitude"], errors="coerce")
+        else:
+            df = pd.DataFrame.from_records(
+                _OBSERVATIONS_ADAPTER.dump_python(observations)
+            )
+    df["taxon_id"] = _id_to_str(df["taxon_id"])
 
     df_observations = df.drop(["photos"], axis=1)
-    df_observations["created_at"] = pd.to_datetime(
-        df_observations["created_at"], format="%Y-%m-%d %H:%M:%S", utc=True
-    ).dt.date
-    df_observations["updated_at"] = pd.to_datetime(
-        df_observations["updated_at"], format="%Y-%m-%d %H:%M:%S", utc=True
-    ).dt.date
-    df_observations["observed_on"] = pd.to_datetime(
-        df_observations["observed_on"], format="%Y-%m-%d %H:%M:%S", utc=True
-    ).dt.date
+    # las fechas que no se pueden leer quedan vacías
+    for column in ["created_at", "updated_at", "observed_on"]:
+        df_observations[column] = pd.to_datetime(
+            df_observations[column], format="ISO8601", utc=True, errors="coerce"
+        ).dt.date
     df_observations["observed_on_time"] = pd.to_datetime(
-        df_observations["time_observed_at"], format="%Y-%m-%d %H:%M:%S", utc=True
+        df_observations["time_observed_at"], format="ISO8601", utc=True, errors="coerce"
     ).dt.time
     df_observations.drop(columns=["time_observed_at"], inplace=True)
 
@@ -467,7 +762,7 @@ def get_dfs(observations, df_taxon=df_taxon) -> pd.DataFrame:
     ]
 
     # Las observaciones con licencia None son Copyright
-    df_observations.loc[df_observations.license_obs.isnull(), "license_obs"] = "C"
+    df_observations["license_obs"] = df_observations["license_obs"].fillna("C")
 
     # Extraemos las columnas taxonómicas
     _get_taxon_columns(df_observations, df_taxon)
@@ -485,10 +780,16 @@ def get_dfs(observations, df_taxon=df_taxon) -> pd.DataFrame:
         ]
     ]
     df_photos = df_photos.explode("photos").reset_index(drop=True)
-    df_photos["photos_id"] = df_photos.photos.str.get("id")
-    df_photos["photos_medium_url"] = df_photos.photos.str.get("medium_url")
-    df_photos["license_photo"] = df_photos.photos.str.get("license_photo")
-    df_photos["attribution"] = df_photos.photos.str.get("attribution")
+    # one pass over the photo dicts, observations without photos give NaN
+    photo_fields = pd.DataFrame.from_records(
+        [photo if isinstance(photo, dict) else {} for photo in df_photos["photos"]],
+        columns=["id", "medium_url", "license_photo", "attribution"],
+        index=df_photos.index,
+    )
+    df_photos["photos_id"] = photo_fields["id"]
+    df_photos["photos_medium_url"] = photo_fields["medium_url"]
+    df_photos["license_photo"] = photo_fields["license_photo"]
+    df_photos["attribution"] = photo_fields["attribution"]
     df_photos = df_photos[
         [
             "id",
@@ -503,52 +804,75 @@ def get_dfs(observations, df_taxon=df_taxon) -> pd.DataFrame:
             "attribution",
         ]
     ]
-    df_photos["photos_id"] = (
-        df_photos["photos_id"].astype(float).apply(lambda x: f"{x:.0f}")
-    )
+    df_photos["photos_id"] = _id_to_str(df_photos["photos_id"])
     df_photos["path"] = (
-        df_photos["id"].astype(str) + "_" + df_photos["photos_id"].astype(str) + ".jpg"
+        df_photos["id"].astype(str) + "_" + df_photos["photos_id"] + ".jpg"
     )
     # El campo queda en blanco en los Copyright
-    df_photos["license_photo"] = np.where(
-        (df_photos["license_photo"].isnull())
-        & (df_photos["attribution"].str.contains("all rights reserved")),
-        "C",
-        df_photos["license_photo"],
+    # (solo se busca en la atribución de las fotos sin licencia)
+    sin_licencia = df_photos["license_photo"].isna()
+    reservados = (
+        df_photos.loc[sin_licencia, "attribution"]
+        .astype("string")
+        .str.contains("all rights reserved", na=False)
+    )
+    df_photos["license_photo"] = df_photos["license_photo"].mask(
+        reservados.reindex(df_photos.index, fill_value=False), "C"
     )
 
     return df_observations, df_photos
 
 
-def _get_taxon_columns(df_obs: pd.DataFrame, df_taxon: pd.DataFrame):
-    df_obs["taxon_ancestry"] = df_obs["taxon_ancestry"].apply(
-        lambda x: _get_dict_taxon(x, df_taxon)
+def _id_to_str(ids: pd.Series) -> pd.Series:
+    """
+    Inner function that formats a column of integer ids as strings,
+    leaving missing ids empty.
+    """
+    return ids.astype("Int64").astype("string").fillna("").astype(str)
+
+
+def _get_taxon_columns(df_obs: pd.DataFrame, df_taxon: Optional[pd.DataFrame] = None):
+    # one row per ancestor of each observation, keeping the observation index
+    ancestors = pd.to_numeric(
+        df_obs["taxon_ancestry"].astype("string").str.split("/").explode(),
+        errors="coerce",
     )
+    ancestors = ancestors[ancestors.notna() & ancestors.ne(1)].astype(int)
+
+    # los ids que no están en el árbol no se incluyen
+    taxa = _get_taxon_table(df_taxon).reindex(ancestors.to_numpy())
+    taxa.index = ancestors.index
 
     for level in ["kingdom", "phylum", "class", "order", "family", "genus"]:
-        df_obs[level] = df_obs.taxon_ancestry.str.get(level)
+        df_obs[level] = (
+            taxa.loc[taxa["rank"] == level, "taxon_name"]
+            .groupby(level=0)
+            .last()
+            .reindex(df_obs.index)
+        )
 
     df_obs.drop(columns=["taxon_ancestry"], inplace=True)
 
 
-def _get_dict_taxon(ancestry_string, df_taxon):
-    try:
-        data = {}
-        list_ancestries = ancestry_string.split("/")
-        for ancestry in list_ancestries:
-            if int(ancestry) != 1:
-                try:
-                    taxon_row = df_taxon[df_taxon["taxon_id"] == int(ancestry)]
-                    rank = taxon_row["rank"].item()
-                    name = taxon_row["taxon_name"].item()
-                    data[rank] = name
-                except:
-                    # para rangos intermedios, no los incluye
-                    continue
-    except:
-        data = None
+def _get_taxon_table(taxon_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    Inner function that returns the rank and name of each taxon indexed by
+    taxon id. The one of the default taxon tree is built only once.
+    """
+    if taxon_df is None:
+        return _get_default_taxon_table()
+    return _build_taxon_table(taxon_df)
+
 
-    return data
+@functools.lru_cache(maxsize=1)
+def _get_default_taxon_table() -> pd.DataFrame:
+    return _build_taxon_table(_load_taxon_df())
+
+
+def _build_taxon_table(taxon_df: pd.DataFrame) -> pd.DataFrame:
+    # ids repeated in the tree are ambiguous, they are left out
+    taxon_df = taxon_df[~taxon_df["taxon_id"].duplicated(keep=False)]
+    return taxon_df.set_index(taxon_df["taxon_id"].astype(int))[["rank", "taxon_name"]]
 
 
 def extra_info(df_observations) -> pd.DataFrame:
@@ -559,40 +883,47 @@ def extra_info(df_observations) -> pd.DataFrame:
     ids = df_observations["id"].to_list()
     dic = {}
 
-    for id_num in ids:
-        url = f"{BASE_URL}/observations/{id_num}.json"
-        session = requests.Session()
-        page = session.get(url)
+    # the ids are requested in batches, each one in a single page of results
+    batches = [
+        ids[i : i + EXTRA_INFO_BATCH] for i in range(0, len(ids), EXTRA_INFO_BATCH)
+    ]
 
-        idents = page.json()["identifications"]
-        if len(idents) > 0:
-            user_identification = idents[0]["user"]["login"]
-            first_taxon_name = idents[0]["taxon"]["name"]
-            last_taxon_name = idents[len(idents) - 1]["taxon"]["name"]
-            dic[id_num] = [user_identification, first_taxon_name, last_taxon_name]
-        else:
-            dic[id_num] = [0, 0, 0]
+    def get_identifications(batch):
+        url = (
+            f"{API_PATH}/observations?id={','.join(map(str, batch))}"
+            f"&per_page={PER_PAGE}"
+        )
+        return _json(_SESSION.get(url))["results"]
+
+    with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as executor:
+        for results in executor.map(get_identifications, batches):
+            for result in results:
+                idents = result.get("identifications") or []
+                if len(idents) > 0:
+                    user_identification = idents[0]["user"]["login"]
+                    first_taxon_name = idents[0]["taxon"]["name"]
+                    last_taxon_name = idents[len(idents) - 1]["taxon"]["name"]
+                    dic[result["id"]] = [
+                        user_identification,
+                        first_taxon_name,
+                        last_taxon_name,
+                    ]
 
-    df_observations["first_identification"] = df_observations["id"].map(
-        lambda x: str(dic[x][0])
-    )
-    df_observations["first_taxon_name"] = df_observations["id"].map(
-        lambda x: str(dic[x][1])
-    )
-    df_observations["last_taxon_name"] = df_observations["id"].map(
-        lambda x: str(dic[x][2])
+    # las observaciones sin identificaciones quedan con 0
+    columns = ["first_identification", "first_taxon_name", "last_taxon_name"]
+    extra = (
+        pd.DataFrame.from_dict(dic, orient="index", columns=columns)
+        .reindex(df_observations["id"].to_numpy(), fill_value="0")
+        .astype(str)
     )
+    df_observations[columns] = extra.to_numpy()
 
-    df_observations["first_taxon_match"] = np.where(
-        df_observations["first_taxon_name"] == df_observations["last_taxon_name"],
-        "True",
-        "False",
-    )
-    df_observations["first_identification_match"] = np.where(
-        df_observations["first_identification"] == df_observations["user_login"],
-        "True",
-        "False",
-    )
+    df_observations["first_taxon_match"] = (
+        df_observations["first_taxon_name"] == df_observations["last_taxon_name"]
+    ).astype(str)
+    df_observations["first_identification_match"] = (
+        df_observations["first_identification"] == df_observations["user_login"]
+    ).astype(str)
 
     return df_observations
 
@@ -607,26 +938,54 @@ def download_photos(
     if not os.path.exists(directorio):
         os.makedirs(directorio)
 
-    session = requests.Session()
-
-    # Iterate through the df_photos query result and download the photos in medium size
-    for i, row in df_photos.iterrows():
-        response = session.get(row["photos_medium_url"], stream=True)
-        if response.status_code == 200:
-            with open(f"{directorio}/{row['path']}", "wb") as out_file:
-                out_file.write(response.content)
-        del response
+    # Download the photos of the df_photos query result in medium size
+    tasks = [
+        (url, f"{directorio}/{path}")
+        for url, path in zip(df_photos["photos_medium_url"], df_photos["path"])
+    ]
+    with ThreadPoolExecutor(max_workers=PHOTO_WORKERS) as executor:
+        list(executor.map(_download_photo, tasks))
 
-    # Even using .loc, we get a SettingWithCopyWarning message
-    df_photos.loc[:, "abs_path"] = os.path.abspath(f"{directorio}/{df_photos['path']}")
+    abs_directorio = os.path.abspath(directorio)
+    df_photos["abs_path"] = abs_directorio + os.sep + df_photos["path"]
 
 
-def get_count_by_taxon() -> Dict:
+def _download_photo(task: Tuple[str, str]):
+    """
+    Internal function that saves the photo at url into path.
+    """
+    url, path = task
+    # observations without photos
+    if not isinstance(url, str):
+        return
+    with _SESSION.get(url, stream=True) as response:
+        if response.status_code != 200:
+            print(f"Photo not downloaded ({response.status_code}): {url}")
+            return
+        response.raw.decode_content = True
+        with open(path, "wb") as out_file:
+            shutil.copyfileobj(response.raw, out_file, PHOTO_CHUNK_SIZE)
+
+
+def get_count_by_taxon(
+    force_refresh: bool = False, session: Optional[requests.Session] = None
+) -> Dict:
     """
     Function that returns the number of observations recorded for each taxonomic family.
+    Results are kept for 10 minutes, force_refresh=True downloads them again.
     """
+    if session is None:
+        session = _SESSION
+    if force_refresh:
+        _get_count_by_taxon.cache_discard(session)
+    # a new dict each time, so callers can't modify the cached result
+    return dict(_get_count_by_taxon(session))
+
+
+@_ttl_cache(ttl=600)
+def _get_count_by_taxon(session: requests.Session = _SESSION) -> Dict:
     url = f"{BASE_URL}/taxa.json"
-    page = requests.get(url)
+    page = session.get(url)
     taxa = page.json()
     count = {}
     for taxon in taxa:
@@ -640,12 +999,15 @@ def get_dwc(observations: List) -> pd.DataFrame:
     Function to get dataframe with DarwinCore Format.
     Take a list of Observation objects to get ids.
     """
-    df_total = pd.DataFrame()
-    id_obs = [observation.id for observation in observations]
-    for id_ob in id_obs:
-        url = f"https://minka-sdg.org/observations.dwc?id={id_ob}"
-        df = pd.read_xml(url, parser="etree")
-        df_total = pd.concat([df_total, df])
+    urls = [
+        f"{BASE_URL}/observations.dwc?id={observation.id}"
+        for observation in observations
+    ]
+    # download the xml of each observation concurrently
+    with ThreadPoolExecutor(max_workers=DWC_WORKERS) as executor:
+        dfs = list(executor.map(_read_dwc, urls))
+
+    df_total = pd.concat(dfs, ignore_index=True)
 
     # clean fields
     df_total["institutionCode"] = "Minka"
@@ -665,7 +1027,7 @@ def get_dwc_from_query(
     year: Optional[int] = None,
     start_on: Optional[date] = None,
     ends_on: Optional[date] = None,
-) -> str:
+) -> Optional[pd.DataFrame]:
     base_url = _build_url_dwc(
         id_obs,
         user_id,
@@ -677,24 +1039,54 @@ def get_dwc_from_query(
         ends_on,
     )
 
-    df_total = pd.DataFrame()
+    dfs = []
 
-    for i in range(1, 50):
-        url = f"{base_url}&page={i}"
+    # pages are requested in concurrent batches, until one page can't be read
+    with ThreadPoolExecutor(max_workers=DWC_PAGE_BATCH) as executor:
+        for first_page in range(1, 50, DWC_PAGE_BATCH):
+            pages = range(first_page, min(first_page + DWC_PAGE_BATCH, 50))
+            batch = list(
+                executor.map(_read_dwc_page, [f"{base_url}&page={i}" for i in pages])
+            )
+            dfs.extend(itertools.takewhile(lambda df: df is not None, batch))
+            if any(df is None for df in batch):
+                break
 
-        try:
-            df = pd.read_xml(url, parser="etree")
-            df_total = pd.concat([df_total, df])
-        except:
-            # clean fields
-            if len(df_total) > 1:
-                df_total["institutionCode"] = "Minka"
-                df_total["datasetName"] = df_total["datasetName"].str.replace(
-                    "iNaturalist", "Minka"
-                )
-            else:
-                df_total = None
-            return df_total
+    if len(dfs) == 0:
+        return None
+
+    df_total = pd.concat(dfs, ignore_index=True)
+
+    # clean fields
+    if len(df_total) > 1:
+        df_total["institutionCode"] = "Minka"
+        df_total["datasetName"] = df_total["datasetName"].str.replace(
+            "iNaturalist", "Minka"
+        )
+    else:
+        df_total = None
+    return df_total
+
+
+def _read_dwc(url: str) -> pd.DataFrame:
+    """
+    Internal function that downloads a DarwinCore xml with the shared
+    session and reads it into a dataframe.
+    """
+    response = _SESSION.get(url)
+    response.raise_for_status()
+    return pd.read_xml(io.BytesIO(response.content), parser=XML_PARSER)
+
+
+def _read_dwc_page(url: str) -> Optional[pd.DataFrame]:
+    """
+    Internal function that reads a page of DarwinCore results, returning
+    None when the page is empty or can't be read.
+    """
+    try:
+        return _read_dwc(url)
+    except:
+        return None
 
 
 def _build_url_dwc(
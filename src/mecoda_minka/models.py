@@ -1,11 +1,12 @@
 from datetime import date, datetime
+from types import MappingProxyType
 from typing import List, Optional
 
 from pydantic import BaseModel
 
 # Objetos de las entidades de nuestro programa: observaciones y proyectos
 
-TAXONS = [
+TAXONS = (
     "Chromista",
     "Protozoa",
     "Animalia",
@@ -29,33 +30,39 @@ TAXONS = [
     "Elasmobranchii",
     "Crustacea",
     "Ctenophora",
-]
+)
 
-ICONIC_TAXON = {
-    1: "life",
-    2: "animalia",
-    3: "actinopterygii",
-    5: "aves",
-    6: "reptilia",
-    7: "amphibia",
-    8: "mammalia",
-    9: "arachnida",
-    11: "insecta",
-    12: "plantae",
-    13: "fungi",
-    14: "protozoa",
-    15: "mollusca",
-    16: "chromista",
-    50: "cnidaria",
-    51: "annelida",
-    52: "platyhelminthes",
-    53: "echinodermata",
-    55: "bryozoa",
-    56: "porifera",
-    177: "elasmobranchii",
-    240789: "crustacea",
-    254021: "ctenophora",
-}
+# para comprobar si un taxon es válido sin recorrer la lista
+TAXONS_SET = frozenset(TAXONS)
+
+# de solo lectura, se comparte entre todas las llamadas
+ICONIC_TAXON = MappingProxyType(
+    {
+        1: "life",
+        2: "animalia",
+        3: "actinopterygii",
+        5: "aves",
+        6: "reptilia",
+        7: "amphibia",
+        8: "mammalia",
+        9: "arachnida",
+        11: "insecta",
+        12: "plantae",
+        13: "fungi",
+        14: "protozoa",
+        15: "mollusca",
+        16: "chromista",
+        50: "cnidaria",
+        51: "annelida",
+        52: "platyhelminthes",
+        53: "echinodermata",
+        55: "bryozoa",
+        56: "porifera",
+        177: "elasmobranchii",
+        240789: "crustacea",
+        254021: "ctenophora",
+    }
+)
 
 
 class Project(BaseModel):
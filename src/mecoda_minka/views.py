@@ -5,10 +5,25 @@ Examples of views made with folium using dataframe from get_dfs method.
 """
 
 import folium
-from folium.plugins import HeatMap, MarkerCluster
+from folium.plugins import FastMarkerCluster, HeatMap, MarkerCluster
 import pandas as pd
 import numpy as np
 
+# from this number of markers, clustering is done in the browser
+FAST_CLUSTER_MIN = 10000
+
+# same green bug icon as the markers of MarkerCluster
+FAST_MARKER_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({
+        icon: 'bug', prefix: 'fa', markerColor: 'green', iconColor: 'white'
+    });
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindPopup(row[2]);
+    return marker;
+};
+"""
+
 def create_heatmap(df):
     df.dropna(subset = ['latitude', 'longitude'], inplace = True)
 
@@ -45,12 +60,22 @@ def create_markercluster(df):
     
     m = folium.Map(location=center, tiles="cartodb positron", zoom_start=1)
 
+    popups = [
+        f"Id: {id_}\n Especie:{taxon_name}"
+        for id_, taxon_name in zip(df['id'].to_numpy(), df['taxon_name'].to_numpy())
+    ]
+
+    if len(df) >= FAST_CLUSTER_MIN:
+        data = [[lat, lon, popup] for (lat, lon), popup in zip(locations, popups)]
+        FastMarkerCluster(data, callback=FAST_MARKER_CALLBACK).add_to(m)
+        return m
+
     marker_cluster = MarkerCluster().add_to(m)
 
-    for i in range(len(df)):
+    for location, popup in zip(locations, popups):
         folium.Marker(
-            location=locations[i],
-            popup=f"Id: {df['id'].values[i]}\n Especie:{df['taxon_name'].values[i]}",
+            location=location,
+            popup=popup,
             #icon=folium.Icon(color="green", icon="ok-sign"),
             icon=folium.Icon(color="green", icon='bug', prefix='fa'),
         ).add_to(marker_cluster)
@@ -2,30 +2,155 @@
 # -*- coding: iso-8859-15 -*-
 
 import datetime
+import importlib.resources as resources
+import inspect
+import math
+import warnings
 
 import pandas as pd
 import pytest
-from pydantic_core._pydantic_core import TzInfo
+import requests
+import requests_mock as rm
 
+import mecoda_minka.mecoda_minka
 from mecoda_minka import (
     ICONIC_TAXON,
     TAXONS,
     Observation,
     Photo,
     Project,
+    download_photos,
     get_count_by_taxon,
     get_dfs,
     get_dwc,
     get_dwc_from_query,
     get_obs,
+    get_obs_df,
     get_project,
+    iter_obs,
+)
+from mecoda_minka.mecoda_minka import (
+    DWC_PAGE_BATCH,
+    ITER_PREFETCH,
+    _URL_FILTERS,
+    _get_count_by_taxon,
+    _get_project,
+    extra_info,
 )
 
 BASE_URL = "https://minka-sdg.org"
 API_URL = "https://api.minka-sdg.org/v1"
 
+# photo urls shared by the mocked responses and the expected results
+RISSOELLA_LARGE = f"{API_URL}/attachments/local_photos/files/2947/large/rissoella_verruculosa.JPG?1468246242"
+RISSOELLA_MEDIUM = f"{API_URL}/attachments/local_photos/files/2947/medium/rissoella_verruculosa.JPG?1468246242"
+RISSOELLA_SMALL = f"{API_URL}/attachments/local_photos/files/2947/small/rissoella_verruculosa.JPG?1468246242"
+AMPHIPODA_LARGE = (
+    f"{BASE_URL}/attachments/local_photos/files/119257/large/D72_7339.jpeg?1666884089"
+)
+AMPHIPODA_MEDIUM = (
+    f"{BASE_URL}/attachments/local_photos/files/119257/medium/D72_7339.jpeg?1666884089"
+)
+AMPHIPODA_SMALL = (
+    f"{BASE_URL}/attachments/local_photos/files/119257/small/D72_7339.jpeg?1666884089"
+)
+AMPHIPODA_SQUARE = (
+    f"{BASE_URL}/attachments/local_photos/files/119257/square/D72_7339.jpeg?1666884089"
+)
+
+# UTC+2 offset of the dates returned by the API
+CEST = datetime.timezone(datetime.timedelta(hours=2))
+
+
+@pytest.fixture(autouse=True, scope="session")
+def bundled_taxon_tree():
+    # get_dfs reads the latest taxon tree from GitHub, the copy bundled with
+    # the package keeps the tests offline; it is read once for all of them
+    df_taxon = pd.read_csv(resources.files("mecoda_minka.data") / "taxon_tree.csv")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(mecoda_minka.mecoda_minka, "_load_taxon_df", lambda: df_taxon)
+        mecoda_minka.mecoda_minka._get_default_taxon_table.cache_clear()
+        yield
+    mecoda_minka.mecoda_minka._get_default_taxon_table.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # each test mocks its own responses for the cached endpoints
+    _get_project.cache_clear()
+    _get_count_by_taxon.cache_clear()
+
+
+def mock_pages(requests_mock, filters, total, record=None, count=None):
+    """
+    Registers the pages of 200 results of an observations query, with
+    `count` results (all of them by default) that only differ in their id.
+    """
+    record = record or {}
+    if count is None:
+        count = total
+    for page, start in enumerate(range(0, count, 200), start=1):
+        page_arg = f"&page={page}" if page > 1 else ""
+        requests_mock.get(
+            f"{API_URL}/observations?{filters}&per_page=200{page_arg}",
+            json=results_page(
+                [
+                    {**record, "id": id_}
+                    for id_ in range(start, min(start + 200, count))
+                ],
+                total,
+                page,
+            ),
+        )
+
+
+def results_page(results, total, page=1, per_page=200):
+    """
+    Builds the json of a page of an observations query.
+    """
+    return {
+        "total_results": total,
+        "page": page,
+        "per_page": per_page,
+        "results": results,
+    }
+
+
+def dwc_xml(records):
+    """
+    Builds the DarwinCore xml returned by observations.dwc, with one
+    SimpleDarwinRecord per dict of terms.
+    """
+    body = "".join(
+        "<dwr:SimpleDarwinRecord>"
+        + "".join(f"<dwc:{term}>{value}</dwc:{term}>" for term, value in record.items())
+        + "</dwr:SimpleDarwinRecord>"
+        for record in records
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<dwr:SimpleDarwinRecordSet xmlns:dwr="http://rs.tdwg.org/dwc/xsd/simpledarwincore/" '
+        'xmlns:dwc="http://rs.tdwg.org/dwc/terms/">'
+        f"{body}</dwr:SimpleDarwinRecordSet>"
+    )
+
+
+@pytest.fixture(scope="session")
+def http_session():
+    # a single session for the whole run, passed with session=
+    return requests.Session()
+
 
-def test_get_project_from_id_extract_project_data():
+@pytest.fixture
+def session_mock(http_session):
+    # a fresh mock adapter per test, so no routes leak between tests
+    adapter = rm.Adapter()
+    http_session.mount("https://", adapter)
+    yield adapter
+    http_session.close()
+
+
+def test_get_project_from_id_extract_project_data(requests_mock):
     expected_result = Project(
         id=20,
         title="BioMARató 2022 (Catalunya)",
@@ -45,11 +170,27 @@ def test_get_project_from_id_extract_project_data():
         observed_taxa_count=0,
     )
 
+    requests_mock.get(
+        f"{BASE_URL}/projects/20.json",
+        json={
+            "id": 20,
+            "title": "BioMARató 2022 (Catalunya)",
+            "description": "La BioMARató es una manera divertida...",
+            "created_at": "2022-04-19T14:24:30.290Z",
+            "updated_at": "2022-10-30T11:58:26.375Z",
+            "latitude": None,
+            "longitude": None,
+            "parent_id": None,
+            "children_id": [],
+            "user_id": 4,
+            "icon_url": "/attachments/projects/icons/20/span2/icon.png?1650378269",
+            "observed_taxa_count": 0,
+        },
+    )
+
     result = get_project(20)
 
-    assert result[0].id == 20
-    assert result[0].created_at.year == 2022
-    assert "Catalunya" in result[0].title
+    assert result == [expected_result]
 
 
 def test_get_project_from_not_found_id_raise_error(requests_mock, capsys):
@@ -58,10 +199,16 @@ def test_get_project_from_not_found_id_raise_error(requests_mock, capsys):
         json={"error": "No encontrado"},
         status_code=404,
     )
-    get_project(11)
+    assert get_project(11) == []
     out, err = capsys.readouterr()
     assert "Project ID not found" in out
 
+    # a project not found is not cached, it is looked up again
+    assert get_project(11) == []
+    out, err = capsys.readouterr()
+    assert "Project ID not found" in out
+    assert requests_mock.call_count == 2
+
 
 def test_get_project_from_str_extract_project_data(requests_mock):
     expected_result = [
@@ -152,15 +299,15 @@ def test_get_obs_by_id_returns_observations_data(
             photos=[
                 Photo(
                     id=1975,
-                    large_url=f"{API_URL}/attachments/local_photos/files/2947/large/rissoella_verruculosa.JPG?1468246242",
-                    medium_url=f"{API_URL}/attachments/local_photos/files/2947/medium/rissoella_verruculosa.JPG?1468246242",
-                    small_url=f"{API_URL}/attachments/local_photos/files/2947/small/rissoella_verruculosa.JPG?1468246242",
+                    large_url=RISSOELLA_LARGE,
+                    medium_url=RISSOELLA_MEDIUM,
+                    small_url=RISSOELLA_SMALL,
                 ),
                 Photo(
                     id=2075,
-                    large_url=f"{API_URL}/attachments/local_photos/files/2947/large/rissoella_verruculosa.JPG?1468246242",
-                    medium_url=f"{API_URL}/attachments/local_photos/files/2947/medium/rissoella_verruculosa.JPG?1468246242",
-                    small_url=f"{API_URL}/attachments/local_photos/files/2947/small/rissoella_verruculosa.JPG?1468246242",
+                    large_url=RISSOELLA_LARGE,
+                    medium_url=RISSOELLA_MEDIUM,
+                    small_url=RISSOELLA_SMALL,
                 ),
             ],
             num_identification_agreements=3,
@@ -169,11 +316,8 @@ def test_get_obs_by_id_returns_observations_data(
     ]
     requests_mock.get(
         f"{API_URL}/observations?id=2084&per_page=200",
-        json={
-            "total_results": 1,
-            "page": 1,
-            "per_page": 30,
-            "results": [
+        json=results_page(
+            [
                 {
                     "id": 2084,
                     "captive": "false",
@@ -200,22 +344,24 @@ def test_get_obs_by_id_returns_observations_data(
                     "photos": [
                         {
                             "id": 1975,
-                            "large_url": f"{API_URL}/attachments/local_photos/files/2947/large/rissoella_verruculosa.JPG?1468246242",
-                            "medium_url": f"{API_URL}/attachments/local_photos/files/2947/medium/rissoella_verruculosa.JPG?1468246242",
-                            "small_url": f"{API_URL}/attachments/local_photos/files/2947/small/rissoella_verruculosa.JPG?1468246242",
+                            "large_url": RISSOELLA_LARGE,
+                            "medium_url": RISSOELLA_MEDIUM,
+                            "small_url": RISSOELLA_SMALL,
                         },
                         {
                             "id": 2075,
-                            "large_url": f"{API_URL}/attachments/local_photos/files/2947/large/rissoella_verruculosa.JPG?1468246242",
-                            "medium_url": f"{API_URL}/attachments/local_photos/files/2947/medium/rissoella_verruculosa.JPG?1468246242",
-                            "small_url": f"{API_URL}/attachments/local_photos/files/2947/small/rissoella_verruculosa.JPG?1468246242",
+                            "large_url": RISSOELLA_LARGE,
+                            "medium_url": RISSOELLA_MEDIUM,
+                            "small_url": RISSOELLA_SMALL,
                         },
                     ],
                     "num_identification_agreements": 3,
                     "num_identification_disagreements": 0,
                 }
             ],
-        },
+            total=1,
+            per_page=30,
+        ),
     )
 
     result = get_obs(id_obs=2084)
@@ -226,21 +372,17 @@ def test_get_obs_by_id_returns_observations_data(
 def test_get_obs_from_query_returns_observations_data_when_less_than_pagination(
     requests_mock,
 ):
+    created_at = datetime.datetime(2021, 3, 15, 16, 10, 39, tzinfo=CEST)
     expected_result = [
-        Observation(
-            id=id,
-            iconic_taxon="animalia",
-            created_at=datetime.datetime(2021, 3, 15, 16, 10, 39, tzinfo=TzInfo(7200)),
+        Observation.model_construct(
+            id=id, iconic_taxon="animalia", created_at=created_at
         )
         for id in range(3)
     ]
     requests_mock.get(
         f"{API_URL}/observations?q=%22quercus%20quercus%22&per_page=200",
-        json={
-            "total_results": 147,
-            "page": 1,
-            "per_page": 200,
-            "results": [
+        json=results_page(
+            [
                 {
                     "id": id,
                     "taxon": {"iconic_taxon_id": 2},
@@ -248,7 +390,8 @@ def test_get_obs_from_query_returns_observations_data_when_less_than_pagination(
                 }
                 for id in range(3)
             ],
-        },
+            total=147,
+        ),
     )
 
     result = get_obs(query="quercus quercus")
@@ -257,113 +400,215 @@ def test_get_obs_from_query_returns_observations_data_when_less_than_pagination(
     assert len(result) == 3
 
 
-def test_get_obs_returns_observations_data_when_more_than_pagination(
-    requests_mock,
+PAGINATION_CASES = [
+    pytest.param(
+        'q="quercus quercus"',
+        {"query": "quercus quercus"},
+        250,
+        {
+            "description": "Pavo real en su hábitat natural",
+            "observed_on": "2021-03-15",
+        },
+        {
+            "description": "Pavo real en su hábitat natural",
+            "observed_on": datetime.date(2021, 3, 15),
+        },
+        id="query",
+    ),
+    pytest.param(
+        "user_login=zolople",
+        {"user": "zolople"},
+        260,
+        {"user_id": 425},
+        {"user_id": 425},
+        id="user",
+    ),
+    pytest.param(
+        "iconic_taxa=Fungi",
+        {"taxon": "Fungi"},
+        456,
+        {
+            "iconic_taxon_id": 13,
+            "taxon": {
+                "id": 39432,
+                "rank": "species",
+                "name": "Cheilymenia theleboloides",
+                "ancestry": None,
+            },
+            "updated_at": "2021-07-12T23:36:48+02:00",
+        },
+        {
+            "iconic_taxon": "fungi",
+            "taxon_id": 39432,
+            "taxon_rank": "species",
+            "taxon_name": "Cheilymenia theleboloides",
+            "taxon_ancestry": None,
+            "updated_at": datetime.datetime(
+                2021,
+                7,
+                12,
+                23,
+                36,
+                48,
+                tzinfo=CEST,
+            ),
+        },
+        id="taxon",
+    ),
+    pytest.param(
+        "place_id=1011",
+        {"place_id": 1011},
+        456,
+        {
+            "taxon": {
+                "id": 2948,
+                "name": "Holothuria",
+                "rank": "genus",
+                "ancestry": None,
+            },
+            "iconic_taxon_id": 3,
+            "user_login": "andrea",
+            "created_at": "2021-08-15T19:43:43",
+        },
+        {
+            "iconic_taxon": "actinopterygii",
+            "user_login": "andrea",
+            "taxon_id": 2948,
+            "taxon_name": "Holothuria",
+            "taxon_rank": "genus",
+            "taxon_ancestry": None,
+            "created_at": datetime.datetime(2021, 8, 15, 19, 43, 43),
+        },
+        id="place_id",
+    ),
+]
+
+
+@pytest.mark.parametrize("filters,kwargs,total,record,expected", PAGINATION_CASES)
+def test_get_obs_returns_all_pages(
+    requests_mock, filters, kwargs, total, record, expected
 ) -> None:
-    expected_result = [
-        Observation(
-            id=id,
-            description="Pavo real en su hábitat natural",
-            observed_on=datetime.date(2021, 3, 15),
+
+    def page_results(request, context):
+        # each page is built when requested, the record only changes its id
+        page = int(request.qs.get("page", ["1"])[0])
+        start = (page - 1) * 200
+        return results_page(
+            [{**record, "id": id_} for id_ in range(start, min(start + 200, total))],
+            total,
+            page,
         )
-        for id in range(250)
-    ]
 
+    # the query of the url only has to be contained in the requested one,
+    # so this matches every page
     requests_mock.get(
-        f'{API_URL}/observations?q="quercus quercus"&per_page=200',
-        json={
-            "total_results": 250,
-            "page": 1,
-            "per_page": 200,
-            "results": [
-                {
-                    "id": id_,
-                    "description": "Pavo real en su hábitat natural",
-                    "observed_on": "2021-03-15",
-                }
-                for id_ in range(200)
-            ],
-        },
-    )
-    requests_mock.get(
-        f'{API_URL}/observations?q="quercus quercus"&per_page=200&page=2',
-        json={
-            "total_results": 250,
-            "page": 2,
-            "per_page": 200,
-            "results": [
-                {
-                    "id": id_,
-                    "description": "Pavo real en su hábitat natural",
-                    "observed_on": "2021-03-15",
-                }
-                for id_ in range(200, 250)
-            ],
-        },
+        f"{API_URL}/observations?{filters}&per_page=200", json=page_results
     )
-    requests_mock.get(
-        f'{API_URL}/observations?q="quercus quercus"&per_page=200&page=100',
-        json=[],
+
+    result = get_obs(**kwargs)
+
+    assert result == [
+        Observation.model_construct(id=id_, **expected) for id_ in range(total)
+    ]
+    pages = sorted(
+        int(r.qs.get("page", ["1"])[0]) for r in requests_mock.request_history
     )
+    assert pages == list(range(1, math.ceil(total / 200) + 1))
 
-    result = get_obs(query="quercus quercus")
 
-    assert result == expected_result
-    assert len(result) == 250
+def test_iter_obs_yields_observations_page_by_page(requests_mock) -> None:
+    mock_pages(requests_mock, "user_login=zolople", 260, {"user_id": 425})
 
+    observations = iter_obs(user="zolople", num_max=250)
 
-def test_get_obs_from_user_returns_observations_data(
-    requests_mock,
-) -> None:
-    expected_result = [
-        Observation(
-            id=id_,
-            user_id=425,
-        )
-        for id_ in range(260)
+    assert requests_mock.call_count == 0
+    assert next(observations) == Observation(id=0, user_id=425)
+    assert [obs.id for obs in observations] == list(range(1, 250))
+    assert requests_mock.call_count == 2
+
+
+def test_iter_obs_stops_downloading_when_closed(requests_mock) -> None:
+    mock_pages(requests_mock, "user_login=zolople", 2000)
+
+    observations = iter_obs(user="zolople")
+    ids = [next(observations).id for _ in range(201)]
+    observations.close()
+
+    assert ids == list(range(201))
+    # the first page, the one being read and the ones requested ahead
+    assert requests_mock.call_count <= 2 + ITER_PREFETCH
+
+
+def test_get_obs_stops_at_max_pages(requests_mock, monkeypatch, capsys) -> None:
+    # a small cap exercises the same path as the 10,000 results limit
+    monkeypatch.setattr(mecoda_minka.mecoda_minka, "MAX_PAGES", 2)
+    mock_pages(requests_mock, "user_login=zolople", 1000, count=400)
+
+    result = get_obs(user="zolople")
+
+    assert len(result) == 400
+    assert requests_mock.call_count == 2
+    assert "Only the first 10,000 results are displayed" in capsys.readouterr().out
+
+
+def test_functions_use_the_given_session(http_session, session_mock) -> None:
+    session_mock.register_uri(
+        "GET",
+        f"{API_URL}/observations?user_login=zolople&per_page=200",
+        json=results_page([{"id": 1, "user_id": 425}], total=1),
+    )
+    session_mock.register_uri(
+        "GET",
+        f"{BASE_URL}/projects/806.json",
+        json={"id": 806, "title": "urbamar"},
+    )
+    session_mock.register_uri(
+        "GET",
+        f"{BASE_URL}/taxa.json",
+        json=[{"name": "Fungi", "observations_count": 7883}],
+    )
+
+    assert get_obs(user="zolople", session=http_session) == [
+        Observation(id=1, user_id=425)
     ]
+    assert get_obs_df(user="zolople", session=http_session)["id"].to_list() == [1]
+    assert get_project(806, session=http_session) == [Project(id=806, title="urbamar")]
+    assert get_count_by_taxon(session=http_session) == {"Fungi": 7883}
+    assert session_mock.call_count == 4
+
+
+def test_get_obs_stops_at_a_page_with_error(requests_mock, capsys) -> None:
+    mock_pages(requests_mock, "user_login=zolople", 1000)
     requests_mock.get(
-        f"{API_URL}/observations?user_login=zolople&per_page=200",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
-                {
-                    "user_id": 425,
-                    "id": id_,
-                }
-                for id_ in range(200)
-            ],
-        },
+        f"{API_URL}/observations?user_login=zolople&per_page=200&page=3",
+        status_code=429,
     )
+
+    result = get_obs(user="zolople")
+
+    # the pages after the error are not joined with a gap
+    assert [obs.id for obs in result] == list(range(400))
+    assert "Error: 429" in capsys.readouterr().out
+
+
+def test_get_obs_stops_at_a_page_without_results(requests_mock, capsys) -> None:
+    mock_pages(requests_mock, "user_login=zolople", 600)
     requests_mock.get(
         f"{API_URL}/observations?user_login=zolople&per_page=200&page=2",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
-                {
-                    "user_id": 425,
-                    "id": id_,
-                }
-                for id_ in range(200, 260)
-            ],
-        },
+        json={"error": "unavailable"},
     )
 
     result = get_obs(user="zolople")
 
-    assert result == expected_result
-    assert len(result) == 260
+    assert len(result) == 200
+    assert "missing 'results' field" in capsys.readouterr().out
 
 
 def test_get_obs_project_returns_observations_data(
     requests_mock,
 ) -> None:
     expected_result = [
-        Observation(
+        Observation.model_construct(
             id=1,
             user_id=id_,
             iconic_taxon="amphibia",
@@ -377,11 +622,8 @@ def test_get_obs_project_returns_observations_data(
 
     requests_mock.get(
         f"{API_URL}/observations?project_id=20&per_page=200",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
+        json=results_page(
+            [
                 {
                     "id": 1,
                     "user_id": id_,
@@ -395,7 +637,8 @@ def test_get_obs_project_returns_observations_data(
                 }
                 for id_ in range(37)
             ],
-        },
+            total=900,
+        ),
     )
     result = get_obs(id_project=20)
 
@@ -418,7 +661,7 @@ def test_get_project_from_name_returns_observations_data(
                 17,
                 7,
                 36,
-                tzinfo=datetime.timezone(datetime.timedelta(seconds=7200)),
+                tzinfo=CEST,
             ),
             description="Urbamar és un projecte de ciència ciutadana.",
             title="URBAMAR",
@@ -447,219 +690,22 @@ def test_get_project_from_name_returns_observations_data(
     assert result == expected_result
 
 
-def test_get_obs_from_taxon_returns_info_with_pagination(
-    requests_mock,
-) -> None:
-    expected_result = [
-        Observation(
-            iconic_taxon="fungi",
-            id=313430,
-            taxon_id=39432,
-            taxon_rank="species",
-            taxon_name="Cheilymenia theleboloides",
-            taxon_ancestry=None,
-            updated_at=datetime.datetime(
-                2021,
-                7,
-                12,
-                23,
-                36,
-                48,
-                tzinfo=datetime.timezone(datetime.timedelta(seconds=7200)),
-            ),
-        )
-        for i in range(456)
-    ]
-
-    requests_mock.get(
-        f"{API_URL}/observations?iconic_taxa=Fungi&per_page=200",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
-                {
-                    "iconic_taxon_id": 13,
-                    "id": 313430,
-                    "taxon": {
-                        "id": 39432,
-                        "rank": "species",
-                        "name": "Cheilymenia theleboloides",
-                        "ancestry": None,
-                    },
-                    "updated_at": "2021-07-12T23:36:48+02:00",
-                }
-                for id_ in range(200)
-            ],
-        },
-    )
-    requests_mock.get(
-        f"{API_URL}/observations?iconic_taxa=Fungi&per_page=200&page=2",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
-                {
-                    "iconic_taxon_id": 13,
-                    "id": 313430,
-                    "taxon": {
-                        "id": 39432,
-                        "rank": "species",
-                        "name": "Cheilymenia theleboloides",
-                        "ancestry": None,
-                    },
-                    "updated_at": "2021-07-12T23:36:48+02:00",
-                }
-                for id_ in range(200)
-            ],
-        },
-    )
-    requests_mock.get(
-        f"{API_URL}/observations?iconic_taxa=Fungi&per_page=200&page=3",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
-                {
-                    "iconic_taxon_id": 13,
-                    "id": 313430,
-                    "taxon": {
-                        "id": 39432,
-                        "rank": "species",
-                        "name": "Cheilymenia theleboloides",
-                        "ancestry": None,
-                    },
-                    "updated_at": "2021-07-12T23:36:48+02:00",
-                }
-                for id_ in range(56)
-            ],
-        },
-    )
-    result = get_obs(taxon="Fungi")
-
-    assert result == expected_result
-    assert len(result) == 456
-
-
-def test_get_obs_from_place_id_returns_obs(
-    requests_mock,
-) -> None:
-    expected_result = [
-        Observation(
-            iconic_taxon="actinopterygii",
-            id=1645,
-            user_login="andrea",
-            taxon_id=2948,
-            taxon_name="Holothuria",
-            taxon_rank="genus",
-            taxon_ancestry=None,
-            created_at=datetime.datetime(
-                2021,
-                8,
-                15,
-                19,
-                43,
-                43,
-            ),
-        )
-        for i in range(456)
-    ]
-
-    requests_mock.get(
-        f"{API_URL}/observations?place_id=1011&per_page=200",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
-                {
-                    "taxon": {
-                        "id": 2948,
-                        "name": "Holothuria",
-                        "rank": "genus",
-                        "ancestry": None,
-                    },
-                    "id": 1645,
-                    "iconic_taxon_id": 3,
-                    "user_login": "andrea",
-                    "created_at": "2021-08-15T19:43:43",
-                }
-                for id_ in range(200)
-            ],
-        },
-    )
-    requests_mock.get(
-        f"{API_URL}/observations?place_id=1011&per_page=200&page=2",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
-                {
-                    "taxon": {
-                        "id": 2948,
-                        "name": "Holothuria",
-                        "rank": "genus",
-                        "ancestry": None,
-                    },
-                    "id": 1645,
-                    "iconic_taxon_id": 3,
-                    "user_login": "andrea",
-                    "created_at": "2021-08-15T19:43:43",
-                }
-                for id_ in range(200)
-            ],
-        },
-    )
-    requests_mock.get(
-        f"{API_URL}/observations?place_id=1011&per_page=200&page=3",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
-                {
-                    "taxon": {
-                        "id": 2948,
-                        "name": "Holothuria",
-                        "rank": "genus",
-                        "ancestry": None,
-                    },
-                    "id": 1645,
-                    "iconic_taxon_id": 3,
-                    "user_login": "andrea",
-                    "created_at": "2021-08-15T19:43:43",
-                }
-                for id_ in range(56)
-            ],
-        },
-    )
-    result = get_obs(place_id=1011)
-    # __import__("pdb").set_trace()
-    assert result == expected_result
-    assert len(result) == 456
-
-
 # test de uso de la función con taxon en minúsculas
 def test_get_obs_from_taxon_min_returns_info(
     requests_mock,
 ) -> None:
     requests_mock.get(
         f"{API_URL}/observations?iconic_taxa=Fungi&per_page=200",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
+        json=results_page(
+            [
                 {
                     "id": 1645,
                     "iconic_taxon_id": 13,
                 }
                 for id_ in range(57)
             ],
-        },
+            total=900,
+        ),
     )
 
     result = get_obs(taxon="fungi")
@@ -673,17 +719,15 @@ def test_get_obs_from_combined_arguments(
 ) -> None:
     requests_mock.get(
         f"{API_URL}/observations?user_login=zolople&iconic_taxa=Mollusca&per_page=200",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
+        json=results_page(
+            [
                 {
                     "id": id_,
                 }
                 for id_ in range(5)
             ],
-        },
+            total=900,
+        ),
     )
     result = get_obs(taxon="Mollusca", user="zolople")
 
@@ -696,21 +740,37 @@ def test_get_obs_from_three_combined_arguments(
 ) -> None:
     requests_mock.get(
         f'{API_URL}/observations?project_id=45&place_id=3&q="quercus quercus"&per_page=200',
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
+        json=results_page(
+            [
                 {"id": 4586, "project": 45, "place": 3, "species": "quercus quercus"},
                 {"id": 4588, "project": 45, "place": 3, "species": "quercus quercus"},
             ],
-        },
+            total=900,
+        ),
     )
     result = get_obs(id_project=45, place_id=3, query="quercus quercus")
 
     assert len(result) == 2
 
 
+@pytest.mark.parametrize("function", [get_obs, get_obs_df, iter_obs])
+def test_observation_functions_take_every_url_filter(function) -> None:
+    # the filters are forwarded by name, so each one needs its own argument
+    assert set(_URL_FILTERS) <= set(inspect.signature(function).parameters)
+
+
+def test_get_obs_forwards_filters_by_name(requests_mock) -> None:
+    requests_mock.get(
+        f"{API_URL}/observations?user_login=zolople&quality_grade=research"
+        "&id_below=10&per_page=5",
+        json=results_page([{"id": 1}], total=1, per_page=5),
+    )
+
+    result = get_obs(id_below=10, num_max=5, grade="research", user="zolople")
+
+    assert [obs.id for obs in result] == [1]
+
+
 def test_get_obs_from_fake_taxon() -> None:
     with pytest.raises(ValueError):
         get_obs(taxon="inexistente")
@@ -746,57 +806,90 @@ def test_get_count_by_taxon_returns_info(
     assert result["Chromista"] == 1375
 
 
-def test_get_obs_from_year_returns_obs(
+def test_get_count_by_taxon_is_cached(
     requests_mock,
 ) -> None:
-    expected_result = [
-        Observation(
-            id=id_,
+    requests_mock.get(
+        f"{BASE_URL}/taxa.json",
+        json=[{"name": "Fungi", "observations_count": 7883}],
+    )
+    result = get_count_by_taxon()
+    result["Fungi"] = 0
+
+    assert get_count_by_taxon() == {"Fungi": 7883}
+    assert requests_mock.call_count == 1
+
+
+def test_get_count_by_taxon_force_refresh_downloads_again(
+    requests_mock,
+) -> None:
+    requests_mock.get(
+        f"{BASE_URL}/taxa.json",
+        json=[{"name": "Fungi", "observations_count": 7883}],
+    )
+    get_count_by_taxon()
+    requests_mock.get(
+        f"{BASE_URL}/taxa.json",
+        json=[{"name": "Fungi", "observations_count": 7900}],
+    )
+
+    assert get_count_by_taxon() == {"Fungi": 7883}
+    assert get_count_by_taxon(force_refresh=True) == {"Fungi": 7900}
+    assert requests_mock.call_count == 2
+
+
+def test_get_project_is_cached_by_argument(requests_mock):
+    for name in ["urbamar", "biomar"]:
+        requests_mock.get(
+            f"{BASE_URL}/projects/search.json?q={name}",
+            json=[{"id": 806, "title": name}],
         )
-        for id_ in range(150)
-    ]
+    get_project("urbamar")
+    get_project("biomar")
+    get_project("urbamar")
+    assert requests_mock.call_count == 2
+
+    get_project("urbamar", force_refresh=True)
+    get_project("biomar")
+    assert requests_mock.call_count == 3
+
+
+def test_get_project_returns_copies_of_the_cached_projects(requests_mock):
+    requests_mock.get(
+        f"{BASE_URL}/projects/20.json", json={"id": 20, "title": "Biomar"}
+    )
+
+    get_project(20)[0].title = "mutated"
+
+    assert get_project(20)[0].title == "Biomar"
+    assert requests_mock.call_count == 1
+
+
+def test_get_obs_from_year_returns_obs(
+    requests_mock,
+) -> None:
+    results = [{"id": id_} for id_ in range(150)]
+    expected_result = [Observation.model_construct(**record) for record in results]
     requests_mock.get(
         f"{API_URL}/observations?year=2018&per_page=200",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
-                {
-                    "id": id_,
-                }
-                for id_ in range(150)
-            ],
-        },
+        json=results_page(results, total=900),
     )
     result = get_obs(year=2018)
 
     assert result == expected_result
     assert len(result) == 150
+    # the first page gives both the total and the results
+    assert requests_mock.call_count == 1
 
 
 def test_get_obs_with_num_max(
     requests_mock,
 ) -> None:
-    expected_result = [
-        Observation(
-            id=id_,
-        )
-        for id_ in range(10)
-    ]
+    results = [{"id": id_} for id_ in range(10)]
+    expected_result = [Observation.model_construct(**record) for record in results]
     requests_mock.get(
-        f"{API_URL}/observations?iconic_taxa=Fungi&per_page=200",
-        json={
-            "total_results": 900,
-            "page": 1,
-            "per_page": 200,
-            "results": [
-                {
-                    "id": id_,
-                }
-                for id_ in range(200)
-            ],
-        },
+        f"{API_URL}/observations?iconic_taxa=Fungi&per_page=10",
+        json=results_page(results, total=900, per_page=10),
     )
     result = get_obs(taxon="fungi", num_max=10)
 
@@ -804,8 +897,9 @@ def test_get_obs_with_num_max(
     assert len(result) == 10
 
 
-def test_get_dfs_extrae_dfs() -> None:
-    observations = [
+@pytest.fixture(scope="module")
+def amphipoda_observations():
+    return [
         Observation(
             id=98441,
             captive=False,
@@ -830,9 +924,9 @@ def test_get_dfs_extrae_dfs() -> None:
             photos=[
                 Photo(
                     id=119257,
-                    large_url=f"{BASE_URL}/attachments/local_photos/files/119257/large/D72_7339.jpeg?1666884089",
-                    medium_url=f"{BASE_URL}/attachments/local_photos/files/119257/medium/D72_7339.jpeg?1666884089",
-                    small_url=f"{BASE_URL}/attachments/local_photos/files/119257/small/D72_7339.jpeg?1666884089",
+                    large_url=AMPHIPODA_LARGE,
+                    medium_url=AMPHIPODA_MEDIUM,
+                    small_url=AMPHIPODA_SMALL,
                 )
             ],
             num_identification_agreements=0,
@@ -842,82 +936,182 @@ def test_get_dfs_extrae_dfs() -> None:
         )
     ]
 
-    expected_result_obs = pd.DataFrame(
-        [
-            {
-                "id": 1,
-                "captive": None,
-                "created_at": None,
-                "updated_at": None,
-                "observed_on": None,
-                "description": None,
-                "iconic_taxon": "animalia",
-                "ancestry": "1/2/4/3/343/1409/35511",
-                "taxon_id": None,
-                "taxon_name": "Thalassoma pavo",
-                "taxon_ancestry": None,
-                "latitude": 40.1,
-                "longitude": -7.5,
-                "place_name": None,
-                "quality_grade": None,
-                "user_id": None,
-                "user_login": "joselu_00",
-                "num_identification_agreements": None,
-                "num_identification_disagreements": None,
-            }
-        ]
-    )
 
-    result_obs, result_photo = get_dfs(observations)
-    assert type(result_obs) == pd.DataFrame
-    assert (len(result_obs)) == len(observations)
+OBSERVATION_COLUMNS = [
+    "id",
+    "created_at",
+    "updated_at",
+    "observed_on",
+    "observed_on_time",
+    "iconic_taxon",
+    "taxon_id",
+    "taxon_rank",
+    "taxon_name",
+    "latitude",
+    "longitude",
+    "obscured",
+    "place_name",
+    "quality_grade",
+    "user_id",
+    "user_login",
+    "license_obs",
+    "identifications_count",
+    "identifiers",
+    "num_identification_agreements",
+    "num_identification_disagreements",
+    "kingdom",
+    "phylum",
+    "class",
+    "order",
+    "family",
+    "genus",
+]
+PHOTO_COLUMNS = [
+    "id",
+    "photos_id",
+    "iconic_taxon",
+    "taxon_name",
+    "photos_medium_url",
+    "user_login",
+    "latitude",
+    "longitude",
+    "license_photo",
+    "attribution",
+    "path",
+]
+
+
+def test_get_dfs_extrae_dfs(amphipoda_observations) -> None:
+    result_obs, result_photo = get_dfs(amphipoda_observations)
+    assert isinstance(result_obs, pd.DataFrame)
+    assert (len(result_obs)) == len(amphipoda_observations)
     assert result_obs["id"].values != None
+    assert list(result_obs.columns) == OBSERVATION_COLUMNS
+    assert list(result_photo.columns) == PHOTO_COLUMNS
+    assert result_photo["path"].item() == "98441_119257.jpg"
 
 
-def test_get_taxon_columns() -> None:
-    observations = [
-        Observation(
-            id=98441,
-            captive=False,
-            created_at=datetime.datetime(
-                2022, 10, 27, 15, 21, 52, 503000, tzinfo=datetime.timezone.utc
-            ),
-            updated_at=datetime.datetime(
-                2022, 10, 28, 8, 37, 38, 904000, tzinfo=datetime.timezone.utc
-            ),
-            observed_on=datetime.date(2020, 12, 24),
-            description=None,
-            iconic_taxon="animalia",
-            taxon_id=372,
-            taxon_name="Amphipoda",
-            taxon_ancestry="1/2/10/118",
-            latitude=42.0138450901,
-            longitude=3.2169726918,
-            place_name="Spain",
-            quality_grade="needs_id",
-            user_id=4,
-            user_login="xasalva",
-            photos=[
-                Photo(
-                    id=119257,
-                    large_url=f"{BASE_URL}/attachments/local_photos/files/119257/large/D72_7339.jpeg?1666884089",
-                    medium_url=f"{BASE_URL}/attachments/local_photos/files/119257/medium/D72_7339.jpeg?1666884089",
-                    small_url=f"{BASE_URL}/attachments/local_photos/files/119257/small/D72_7339.jpeg?1666884089",
-                )
-            ],
-            num_identification_agreements=0,
-            num_identification_disagreements=0,
-            identifications_count=2,
-            id_please=False,
-        )
-    ]
-
-    df_obs, df_photos = get_dfs(observations)
-    assert type(df_obs) == pd.DataFrame
+def test_get_taxon_columns(amphipoda_observations) -> None:
+    df_obs, df_photos = get_dfs(amphipoda_observations)
+    assert isinstance(df_obs, pd.DataFrame)
     assert df_obs["class"].item() == "Malacostraca"
 
 
-def test_get_dwc() -> None:
+def test_get_dfs_leaves_unreadable_dates_empty() -> None:
+    observation = {field: None for field in Observation.model_fields}
+    observation.update(
+        id=1,
+        created_at="2022-10-27T15:21:52.503Z",
+        updated_at="not a date",
+        observed_on="2022-10-27",
+        time_observed_at="2022-10-27T10:00:00+02:00",
+        photos=[],
+    )
+
+    df_obs, df_photos = get_dfs([observation])
+
+    assert df_obs["created_at"].item() == datetime.date(2022, 10, 27)
+    assert pd.isna(df_obs["updated_at"].item())
+    assert df_obs["observed_on"].item() == datetime.date(2022, 10, 27)
+    assert df_obs["observed_on_time"].item() == datetime.time(8, 0)
+
+
+def test_get_dfs_reads_generators_and_tuples(requests_mock) -> None:
+    mock_pages(
+        requests_mock,
+        "user_login=zolople",
+        260,
+        {
+            "created_at": "2021-03-15T16:10:39+02:00",
+            "location": "41.773743,3.021853",
+            "taxon": {
+                "id": 372,
+                "name": "Amphipoda",
+                "rank": "order",
+                "ancestry": "1/2/10/118",
+            },
+        },
+    )
+    expected_obs, expected_photos = get_dfs(get_obs(user="zolople"))
+
+    df_obs, df_photos = get_dfs(iter_obs(user="zolople"))
+    pd.testing.assert_frame_equal(df_obs, expected_obs)
+    pd.testing.assert_frame_equal(df_photos, expected_photos)
+
+    # a tuple is dumped without pydantic serializer warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        df_obs, df_photos = get_dfs(tuple(get_obs(user="zolople")))
+    pd.testing.assert_frame_equal(df_obs, expected_obs)
+
+
+def test_get_dfs_with_own_taxon_tree() -> None:
+    df_taxon = pd.DataFrame(
+        {
+            "taxon_id": [2, 3, 4],
+            "rank": ["kingdom", "family", "genus"],
+            "taxon_name": ["Animalia", "Sparidae", "Diplodus"],
+        }
+    )
+    observations = [Observation(id=1, taxon_id=5, taxon_ancestry="1/2/3/4")]
+
+    df_obs, df_photos = get_dfs(observations, df_taxon=df_taxon)
+
+    assert df_obs["kingdom"].item() == "Animalia"
+    assert df_obs["family"].item() == "Sparidae"
+    assert df_obs["genus"].item() == "Diplodus"
+    assert pd.isna(df_obs["class"].item())
+
+
+def test_extra_info_requests_ids_in_batches(requests_mock) -> None:
+    requests_mock.get(
+        f"{API_URL}/observations?id=1,2,3&per_page=200",
+        json={
+            "total_results": 2,
+            "results": [
+                {
+                    "id": 1,
+                    "identifications": [
+                        {"user": {"login": "zolople"}, "taxon": {"name": "Diplodus"}},
+                        {"user": {"login": "xasalva"}, "taxon": {"name": "Sparidae"}},
+                    ],
+                },
+                {
+                    "id": 2,
+                    "identifications": [
+                        {"user": {"login": "xasalva"}, "taxon": {"name": "Octopus"}},
+                    ],
+                },
+            ],
+        },
+    )
+    df = pd.DataFrame({"id": [1, 2, 3], "user_login": ["zolople", "zolople", "x"]})
+
+    df = extra_info(df)
+
+    assert requests_mock.call_count == 1
+    assert df["first_identification"].to_list() == ["zolople", "xasalva", "0"]
+    assert df["first_taxon_name"].to_list() == ["Diplodus", "Octopus", "0"]
+    assert df["last_taxon_name"].to_list() == ["Sparidae", "Octopus", "0"]
+    assert df["first_taxon_match"].to_list() == ["False", "True", "True"]
+    assert df["first_identification_match"].to_list() == ["True", "False", "False"]
+
+
+def test_get_dwc(requests_mock) -> None:
+    # one DarwinCore xml per observation
+    for id_ in range(100, 103):
+        requests_mock.get(
+            f"{BASE_URL}/observations.dwc?id={id_}",
+            text=dwc_xml(
+                [
+                    {
+                        "occurrenceID": id_,
+                        "institutionCode": "iNaturalist",
+                        "datasetName": "iNaturalist research-grade observations",
+                    }
+                ]
+            ),
+        )
     observations = [
         Observation(id=100),
         Observation(id=101),
@@ -926,13 +1120,34 @@ def test_get_dwc() -> None:
     result = get_dwc(observations)
 
     assert len(result) == 3
-    assert type(result) == pd.DataFrame
+    assert isinstance(result, pd.DataFrame)
 
-    assert len(result.columns) == 35
+    assert result.columns.tolist() == ["occurrenceID", "institutionCode", "datasetName"]
+    assert result["occurrenceID"].tolist() == [100, 101, 102]
     assert result["institutionCode"].iloc[0] == "Minka"
+    assert result["datasetName"].iloc[0] == "Minka research-grade observations"
 
 
-def test_get_dwc_from_query() -> None:
+def test_get_dwc_from_query(requests_mock) -> None:
+    url = (
+        f"{BASE_URL}/observations.dwc?user_id=4&place_id=55&taxon_id=4"
+        "&d1=2022-10-01&d2=2022-10-10&per_page=200"
+    )
+    # two pages of results, the third one is empty and ends the query
+    for page, ids in [(1, range(200)), (2, range(200, 275)), (3, [])]:
+        requests_mock.get(
+            f"{url}&page={page}",
+            text=dwc_xml(
+                {
+                    "occurrenceID": id_,
+                    "institutionCode": "iNaturalist",
+                    "datasetName": "iNaturalist research-grade observations",
+                    "phylum": "Chordata",
+                }
+                for id_ in ids
+            ),
+        )
+
     result = get_dwc_from_query(
         user_id=4,  # xasalva
         taxon_id=4,  # filo chordata
@@ -940,53 +1155,213 @@ def test_get_dwc_from_query() -> None:
         start_on="2022-10-01",
         ends_on="2022-10-10",
     )
-    assert len(result) > 70
-    assert type(result) == pd.DataFrame
-    assert len(result.columns) >= 33
+    assert isinstance(result, pd.DataFrame)
+    # the columns are the terms of the xml, in the same order
+    assert result.columns.tolist() == [
+        "occurrenceID",
+        "institutionCode",
+        "datasetName",
+        "phylum",
+    ]
+    assert result["occurrenceID"].tolist() == list(range(275))
     assert result["institutionCode"].iloc[0] == "Minka"
+    assert result["datasetName"].iloc[0] == "Minka research-grade observations"
+    assert requests_mock.call_count == DWC_PAGE_BATCH
 
 
 # correctly converts observations to DataFrame
-def test_correctly_converts_observations_to_dataframe():
-    observations = [
-        Observation(
-            id=98441,
-            captive=False,
-            created_at=datetime.datetime(
-                2022, 10, 27, 15, 21, 52, 503000, tzinfo=datetime.timezone.utc
-            ),
-            updated_at=datetime.datetime(
-                2022, 10, 28, 8, 37, 38, 904000, tzinfo=datetime.timezone.utc
-            ),
-            observed_on=datetime.date(2020, 12, 24),
-            description=None,
-            iconic_taxon="animalia",
-            taxon_id=372,
-            taxon_name="Amphipoda",
-            taxon_ancestry="1/2/10/118",
-            latitude=42.0138450901,
-            longitude=3.2169726918,
-            place_name="Spain",
-            quality_grade="needs_id",
-            user_id=4,
-            user_login="xasalva",
-            photos=[
-                Photo(
-                    id=119257,
-                    large_url=f"{BASE_URL}/attachments/local_photos/files/119257/large/D72_7339.jpeg?1666884089",
-                    medium_url=f"{BASE_URL}/attachments/local_photos/files/119257/medium/D72_7339.jpeg?1666884089",
-                    small_url=f"{BASE_URL}/attachments/local_photos/files/119257/small/D72_7339.jpeg?1666884089",
-                )
+def test_correctly_converts_observations_to_dataframe(amphipoda_observations):
+    result_obs, result_photo = get_dfs(amphipoda_observations)
+
+    assert isinstance(result_obs, pd.DataFrame)
+    assert len(result_obs) == len(amphipoda_observations)
+    assert "id" in result_obs.columns
+
+
+def test_get_obs_as_dict_feeds_get_dfs(
+    requests_mock,
+) -> None:
+    requests_mock.get(
+        f"{API_URL}/observations?year=2018&per_page=200",
+        json=results_page(
+            [
+                {
+                    "id": id_,
+                    "created_at": "2021-03-15T16:10:39+02:00",
+                    "location": "41.773743,3.021853",
+                    "taxon": {
+                        "id": 372,
+                        "name": "Amphipoda",
+                        "rank": "order",
+                        "ancestry": "1/2/10/118",
+                    },
+                }
+                for id_ in range(3)
             ],
-            num_identification_agreements=0,
-            num_identification_disagreements=0,
-            identifications_count=2,
-            id_please=False,
+            total=3,
+        ),
+    )
+    result = get_obs(year=2018, as_dict=True)
+
+    assert isinstance(result[0], dict)
+    assert result[0]["taxon_name"] == "Amphipoda"
+    assert len(result) == 3
+
+    df_obs, df_photos = get_dfs(result)
+    assert len(df_obs) == 3
+    assert df_obs["latitude"].iloc[0] == 41.773743
+    assert df_obs["created_at"].iloc[0] == datetime.date(2021, 3, 15)
+    assert df_obs["class"].iloc[0] == "Malacostraca"
+
+
+def test_get_obs_builds_photo_urls_from_square_url(
+    requests_mock,
+) -> None:
+    requests_mock.get(
+        f"{API_URL}/observations?id=98441&per_page=200",
+        json=results_page(
+            [
+                {
+                    "id": 98441,
+                    "observation_photos": [
+                        {
+                            "photo": {
+                                "id": 119257,
+                                "url": AMPHIPODA_SQUARE,
+                                "license_code": "cc-by",
+                                "attribution": "(c) xasalva",
+                            }
+                        }
+                    ],
+                }
+            ],
+            total=1,
+        ),
+    )
+    result = get_obs(id_obs=98441)
+
+    assert result[0].photos == [
+        Photo(
+            id=119257,
+            large_url=AMPHIPODA_LARGE,
+            medium_url=AMPHIPODA_MEDIUM,
+            small_url=AMPHIPODA_SMALL,
+            license_photo="cc-by",
+            attribution="(c) xasalva",
         )
     ]
 
-    result_obs, result_photo = get_dfs(observations)
 
-    assert type(result_obs) == pd.DataFrame
-    assert len(result_obs) == len(observations)
-    assert "id" in result_obs.columns
+def test_get_obs_as_dict_matches_observations(
+    requests_mock,
+) -> None:
+    requests_mock.get(
+        f"{API_URL}/observations?user_login=xasalva&per_page=200",
+        json=results_page(
+            [
+                {
+                    "id": 98441,
+                    "created_at": "2022-10-27T15:21:52.503+00:00",
+                    "observed_on": "2020-12-24",
+                    "place_guess": "Spain\r\n",
+                    "description": "Amphipoda\r\nen roca",
+                    "taxon": {
+                        "id": 372,
+                        "name": "Amphipoda",
+                        "rank": "order",
+                        "ancestry": "1/2/10/118",
+                        "iconic_taxon_id": 2,
+                    },
+                    "location": "42.0138450901,3.2169726918",
+                    "obscured": True,
+                    "private_location": "42.01,3.21",
+                    "user": {"id": 4, "login": "xasalva"},
+                    "license_code": "cc-by",
+                    "identifications": [
+                        {"user": {"login": "xasalva"}},
+                        {"user": {"login": "zolople"}},
+                    ],
+                    "observation_photos": [
+                        {
+                            "photo": {
+                                "id": 119257,
+                                "url": AMPHIPODA_SQUARE,
+                                "license_code": None,
+                                "attribution": "(c) xasalva, all rights reserved",
+                            }
+                        }
+                    ],
+                },
+                {
+                    "id": 98442,
+                    "iconic_taxon_id": 16,
+                    "taxon": None,
+                    "location": None,
+                    "license": "cc0",
+                    "identifications": [],
+                },
+            ],
+            total=2,
+        ),
+    )
+    result = get_obs(user="xasalva", as_dict=True)
+
+    assert [Observation(**obs) for obs in result] == get_obs(user="xasalva")
+    assert result[0]["latitude"] == 42.01
+    assert result[0]["identifiers"] == "xasalva, zolople"
+    assert result[1]["iconic_taxon"] == "chromista"
+
+    df = get_obs_df(user="xasalva")
+    assert isinstance(df, pd.DataFrame)
+    assert df["id"].tolist() == [98441, 98442]
+    assert df["taxon_id"].dtype == "Int64"
+    assert df["taxon_id"].tolist() == [372, pd.NA]
+    assert df["user_id"].tolist() == [4, pd.NA]
+
+    df_obs, df_photos = get_dfs(df)
+    df_obs_from_objects, df_photos_from_objects = get_dfs(get_obs(user="xasalva"))
+    pd.testing.assert_frame_equal(df_obs, df_obs_from_objects, check_dtype=False)
+    pd.testing.assert_frame_equal(df_photos, df_photos_from_objects, check_dtype=False)
+
+
+def test_download_photos_saves_files_and_abs_path(requests_mock, tmp_path) -> None:
+    medium_url = (
+        f"{BASE_URL}/attachments/local_photos/files/119257/medium/D72_7339.jpeg"
+    )
+    requests_mock.get(medium_url, content=b"jpeg")
+    df_photos = pd.DataFrame(
+        {
+            "photos_medium_url": [medium_url, None],
+            "path": ["98441_119257.jpg", "98442_.jpg"],
+        }
+    )
+
+    download_photos(df_photos, str(tmp_path))
+
+    assert (tmp_path / "98441_119257.jpg").read_bytes() == b"jpeg"
+    assert not (tmp_path / "98442_.jpg").exists()
+    assert df_photos["abs_path"].tolist() == [
+        str(tmp_path / "98441_119257.jpg"),
+        str(tmp_path / "98442_.jpg"),
+    ]
+
+
+def test_download_photos_reports_photos_not_downloaded(
+    requests_mock, tmp_path, capsys
+) -> None:
+    medium_url = f"{BASE_URL}/attachments/local_photos/files/1/medium/missing.jpeg"
+    requests_mock.get(medium_url, status_code=404)
+    df_photos = pd.DataFrame({"photos_medium_url": [medium_url], "path": ["1_1.jpg"]})
+
+    download_photos(df_photos, str(tmp_path))
+
+    assert not (tmp_path / "1_1.jpg").exists()
+    assert f"Photo not downloaded (404): {medium_url}" in capsys.readouterr().out
+
+
+def test_shared_session_retries_throttled_requests() -> None:
+    retry = mecoda_minka.mecoda_minka._SESSION.adapters["https://"].max_retries
+
+    assert retry.total == 5
+    assert 429 in retry.status_forcelist
+    assert retry.respect_retry_after_header